@@ -1,12 +1,21 @@
 from neo4j import GraphDatabase
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 import logging
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 class Neo4jClient:
     def __init__(self, uri: str, username: str, password: str):
-        self.driver = GraphDatabase.driver(uri, auth=(username, password))
+        # One pooled driver per client; it is meant to live for the whole process
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(username, password),
+            max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=settings.NEO4J_ACQ_TIMEOUT,
+            max_transaction_retry_time=settings.NEO4J_MAX_TX_RETRY_TIME
+        )
     
     def close(self):
         if self.driver:
@@ -14,25 +23,39 @@ class Neo4jClient:
     
     def run(self, cypher: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Execute a Cypher query and return results"""
-        with self.driver.session() as session:
-            result = session.run(cypher, params or {})
-            return [record.data() for record in result]
+        records, _, _ = self.driver.execute_query(cypher, params or {}, database_=settings.NEO4J_DATABASE)
+        return [record.data() for record in records]
     
     def execute_transaction(self, cypher: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Execute a Cypher query within a transaction"""
-        def _run_query(tx, cypher, params):
-            result = tx.run(cypher, params or {})
-            return [record.data() for record in result]
+        # driver.execute_query already runs inside a managed (retried) write transaction
+        records, _, _ = self.driver.execute_query(cypher, params or {}, database_=settings.NEO4J_DATABASE)
+        return [record.data() for record in records]
+    
+    def run_scalar(self, cypher: str, params: Dict[str, Any] = None, key: str = None) -> List[Any]:
+        """Execute a Cypher query and return a single column per record instead of full dicts"""
+        records, _, _ = self.driver.execute_query(cypher, params or {}, database_=settings.NEO4J_DATABASE)
+        return [record[key] if key is not None else record[0] for record in records]
+    
+    def execute_many(self, statements: Sequence[Tuple[str, Optional[Dict[str, Any]]]]) -> List[List[Dict[str, Any]]]:
+        """Execute several Cypher statements in a single write transaction with one commit"""
+        def _run_statements(tx):
+            results = []
+            for cypher, params in statements:
+                result = tx.run(cypher, params or {})
+                results.append([record.data() for record in result])
+            return results
         
-        with self.driver.session() as session:
-            return session.execute_write(_run_query, cypher, params)
+        with self.driver.session(database=settings.NEO4J_DATABASE) as session:
+            return session.execute_write(_run_statements)
     
     def health_check(self) -> bool:
         """Check if Neo4j connection is healthy"""
         try:
-            with self.driver.session() as session:
-                session.run("RETURN 1")
-            return True
+            # Auto-commit session.run rather than the retried execute_query, so a down database fails fast
+            with self.driver.session(database=settings.NEO4J_DATABASE) as session:
+                record = session.run("RETURN 1 AS health").single()
+            return record is not None and record["health"] == 1
         except Exception as e:
             logger.error(f"Neo4j health check failed: {e}")
             return False
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List
 
 class Node(BaseModel):
@@ -6,6 +6,8 @@ class Node(BaseModel):
     version: str
 
 class Edge(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+
     from_: str = Field(alias="from")
     to: str
     since: str
@@ -1,14 +1,33 @@
-import os
-from pydantic import BaseSettings
+from pydantic import Field, field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
-    NEO4J_URI: str = os.getenv("NEO4J_URI", "bolt://localhost:7687")  # ❌ os not imported
-    NEO4J_USERNAME: str = os.getenv("NEO4J_USERNAME", "neo4j")
-    NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD", "password")
-    NEO4J_DATABASE: str = os.getenv("NEO4J_DATABASE", "neo4j")
-    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
-
-    class Config:
-        env_file = ".env"
+    # Values come from the environment or .env; unrelated keys in .env (e.g. AURA_*) are ignored
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore", frozen=True)
+
+    NEO4J_URI: str = "bolt://localhost:7687"
+    NEO4J_USERNAME: str = "neo4j"
+    NEO4J_PASSWORD: str = "password"
+    NEO4J_DATABASE: str = "neo4j"
+    NEO4J_MAX_POOL_SIZE: int = 50
+    NEO4J_READ_MAX_POOL_SIZE: int = 50
+    NEO4J_ACQ_TIMEOUT: float = 30.0
+    NEO4J_MAX_TX_RETRY_TIME: float = 15.0
+    NEO4J_CONNECTION_TIMEOUT: float = 15.0
+    NEO4J_FETCH_SIZE: int = 1000
+    LOG_LEVEL: str = "INFO"
+    INGEST_BATCH_SIZE: int = Field(1000, gt=0)
+    INGEST_MAX_BODY_BYTES: int = 100 * 1024 * 1024
+    CYCLE_MAX_DEPTH: int = 10
+    TRACK_DEPENDENCY_INSTANCES: bool = True
+    QUERY_CACHE_TTL: float = 5.0
+    QUERY_CACHE_SIZE: int = 1024
+    GZIP_MIN_SIZE: int = 1024
+
+    @field_validator("LOG_LEVEL")
+    @classmethod
+    def _normalize_log_level(cls, value: str) -> str:
+        # logging only accepts upper-case level names; allow LOG_LEVEL=info as well
+        return value.upper()
 
 settings = Settings()
\ No newline at end of file
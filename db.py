@@ -1,14 +1,96 @@
-from neo4j_client import AsyncNeo4jClient
+from neo4j_client import AsyncNeo4jClient, is_read_query, query_key
+from config import settings
+from collections import OrderedDict
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
+# Cypher statements are module-level constants so every call sends the identical, fully
+# parameterized text and hits Neo4j's query plan cache. Never interpolate values into them.
+_SCHEMA_QUERIES = (
+    "CREATE CONSTRAINT instance_name IF NOT EXISTS FOR (i:Instance) REQUIRE i.name IS UNIQUE",
+    "CREATE CONSTRAINT module_name IF NOT EXISTS FOR (m:Module) REQUIRE m.name IS UNIQUE",
+    "CREATE INDEX module_version IF NOT EXISTS FOR (m:Module) ON (m.version)"
+)
+
+_INSTANCE_MERGE = """
+MERGE (i:Instance { name: $instance_name }) 
+ON CREATE SET i.created = timestamp()
+RETURN count(i) as instances_processed
+"""
+
+_MODULES_UNWIND = """
+UNWIND $rows AS row
+MERGE (i:Instance { name: $instance_name })
+ON CREATE SET i.created = timestamp()
+MERGE (m:Module { name: row.name })
+ON CREATE SET m.version = row.version, m.created = timestamp()
+MERGE (i)-[:DEPLOYS]->(m)
+RETURN count(DISTINCT m) as modules_created, count(*) as relationships_created
+"""
+
+# Edge batches are sent column-wise (one list per field, indexed by position) rather than as a
+# list of maps, so the Bolt payload doesn't repeat every key for every row. Endpoints are
+# MATCHed, not MERGEd: they were created by the module batches of the same ingest.
+_EDGES_UNWIND = """
+UNWIND range(0, size($from_names) - 1) AS idx
+MATCH (m_from:Module { name: $from_names[idx] })
+MATCH (m_to:Module { name: $to_names[idx] })
+
+// Create unique DEPENDS_ON relationship
+MERGE (m_from)-[dep_on:DEPENDS_ON]->(m_to)
+ON CREATE SET dep_on.created = timestamp(), dep_on.instances = [$instance_name]
+ON MATCH SET dep_on.instances = 
+    CASE 
+        WHEN $instance_name IN dep_on.instances THEN dep_on.instances
+        ELSE dep_on.instances + $instance_name
+    END
+
+RETURN count(DISTINCT dep_on) as dependencies_created
+"""
+
+# Same as _EDGES_UNWIND without maintaining dep_on.instances, which costs a list scan per re-ingested edge
+_EDGES_UNWIND_UNTRACKED = """
+UNWIND range(0, size($from_names) - 1) AS idx
+MATCH (m_from:Module { name: $from_names[idx] })
+MATCH (m_to:Module { name: $to_names[idx] })
+MERGE (m_from)-[dep_on:DEPENDS_ON]->(m_to)
+ON CREATE SET dep_on.created = timestamp()
+RETURN count(DISTINCT dep_on) as dependencies_created
+"""
+
+_APOC_CHECK = "RETURN apoc.version() as version"
+
+# Only modules with both an incoming and an outgoing DEPENDS_ON can sit on a cycle,
+# so everything else is pruned before the APOC walk
+_CYCLE_QUERY = """
+MATCH (m:Module)
+WHERE (m)-[:DEPENDS_ON]->() AND ()-[:DEPENDS_ON]->(m)
+WITH collect(m) AS modules
+CALL apoc.nodes.cycles(modules, {relTypes: ['DEPENDS_ON'], maxDepth: $max_depth})
+YIELD path
+WITH [n IN nodes(path) WHERE 'Module' IN labels(n) | n.name] AS moduleNames
+WHERE size(moduleNames) > 0
+MATCH (i:Instance)-[:DEPLOYS]->(m:Module)
+WHERE m.name IN moduleNames
+RETURN moduleNames, collect(DISTINCT i.name) AS deployingInstances
+"""
+
 class Neo4jDatabase:
     """Neo4j database interface using the async client"""
     
     client: Optional[AsyncNeo4jClient] = None
+    apoc_available: bool = False
+    # LRU of read-query results: query_key -> (expires_at, records). Records are copied on the way in
+    # and out, so a caller mutating its result or its record dicts can't change later cache hits.
+    # The copies are shallow: nested lists/maps inside a record are shared and must not be mutated.
+    _query_cache: "OrderedDict[Tuple[str, str], Tuple[float, Tuple[Dict[str, Any], ...]]]" = OrderedDict()
+    # Bumped on every clear; a read that started before a clear must not refill the cache with older data
+    _cache_generation: int = 0
     
     @classmethod
     async def initialize(cls):
@@ -18,12 +100,40 @@ class Neo4jDatabase:
         try:
             cls.client = AsyncNeo4jClient()
             await cls.client.connect()
+            await cls.ensure_schema()
+            await cls.detect_apoc()
             logger.info("Neo4j database initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Neo4j database: {e}")
+            logger.error("Failed to initialize Neo4j database: %s", e)
             cls.client = None
             raise
     
+    @classmethod
+    async def ensure_schema(cls):
+        """Create the constraints and indexes backing the MERGE lookups used during ingestion"""
+        for query in _SCHEMA_QUERIES:
+            await cls.client.execute_query(query)
+        logger.info("Neo4j schema constraints and indexes ensured")
+    
+    @classmethod
+    async def detect_apoc(cls):
+        """Probe once for APOC procedures and cache the result for analyze_cycles"""
+        try:
+            await cls.client.execute_query(_APOC_CHECK)
+            cls.apoc_available = True
+            logger.info("APOC procedures are available")
+        except Exception as apoc_error:
+            cls.apoc_available = False
+            logger.warning("APOC procedures not available: %s", apoc_error)
+    
+    @classmethod
+    def clear_query_cache(cls):
+        """Drop all cached read-query results and detach reads still in flight from later callers"""
+        cls._cache_generation += 1
+        cls._query_cache.clear()
+        if cls.client:
+            cls.client.invalidate_reads()
+    
     @classmethod
     async def close(cls):
         """Close the Neo4j client"""
@@ -34,103 +144,104 @@ class Neo4jDatabase:
     
     @classmethod
     async def ingest_graph(cls, instance_name: str, modules: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Ingest instance, modules and dependencies into Neo4j following the exact schema conventions"""
+        """Ingest instance, modules and dependencies into Neo4j following the exact schema conventions
+        
+        Edges may only reference modules present in ``modules``; other edges are skipped by the MATCH.
+        """
         if not cls.client or not cls.client.is_connected:
             raise HTTPException(status_code=500, detail="Database not connected")
         
-        logger.info(f"Starting graph ingestion for instance '{instance_name}' with {len(modules)} modules and {len(edges)} edges")
+        # Drop duplicates before they reach the database: last version wins per module name,
+        # and each (from_name, to_name) dependency is sent once. Rows are sorted by name so concurrent
+        # instance transactions lock the :Module nodes they share in the same order and don't deadlock.
+        modules = sorted({module["name"]: module for module in modules}.values(), key=lambda module: module["name"])
+        edges = [edge for _, edge in sorted({(edge["from_name"], edge["to_name"]): edge for edge in edges}.items())]
+        
+        logger.info("Starting graph ingestion for instance '%s' with %d modules and %d edges", instance_name, len(modules), len(edges))
         
         try:
-            # Step 1: Create/merge Instance node
-            instance_query = """
-            MERGE (i:Instance { name: $instance_name }) 
-            ON CREATE SET i.created = timestamp()
-            RETURN count(i) as instances_processed
-            """
+            # Rows are sent in chunks of batch_size to bound the parameter size and transaction state of each statement
+            batch_size = settings.INGEST_BATCH_SIZE
             
-            instance_result = await cls.client.execute_query(instance_query, {"instance_name": instance_name})
-            instances_processed = instance_result[0]["instances_processed"] if instance_result else 0
+            # Step 1: Create/merge Instance node
+            instance_statement = (_INSTANCE_MERGE, {"instance_name": instance_name})
             
-            # Step 2: Create/merge Module nodes and Instance->Module relationships
-            modules_created = 0
-            instance_module_relationships = 0
+            # Step 2: Create/merge Module nodes and Instance->Module relationships in batches
+            modules_payload = [
+                {"name": module["name"], "version": module.get("version", "unknown")}
+                for module in modules
+            ]
+            module_statements = [
+                (_MODULES_UNWIND, {"rows": modules_payload[start:start + batch_size], "instance_name": instance_name})
+                for start in range(0, len(modules_payload), batch_size)
+            ]
             
-            for module in modules:
-                module_query = """
-                MERGE (i:Instance { name: $instance_name }) 
-                ON CREATE SET i.created = timestamp()
-                MERGE (m:Module { name: $module_name }) 
-                ON CREATE SET m.version = $module_version, m.created = timestamp()
-                MERGE (i)-[:DEPLOYS]->(m)
-                MERGE (m)-[:DEPLOYED_BY]->(i)
-                RETURN count(m) as modules_created, count(i) as relationships_created
-                """
-                
-                module_result = await cls.client.execute_query(module_query, {
-                    "instance_name": instance_name,
-                    "module_name": module["name"],
-                    "module_version": module.get("version", "unknown")
+            # Step 3: Create Module->Module dependency relationships with uniqueness in batches
+            from_names = [edge["from_name"] for edge in edges]
+            to_names = [edge["to_name"] for edge in edges]
+            edges_query = _EDGES_UNWIND if settings.TRACK_DEPENDENCY_INSTANCES else _EDGES_UNWIND_UNTRACKED
+            edge_statements = [
+                (edges_query, {
+                    "from_names": from_names[start:start + batch_size],
+                    "to_names": to_names[start:start + batch_size],
+                    "instance_name": instance_name
                 })
-                
-                if module_result:
-                    modules_created += module_result[0]["modules_created"]
-                    instance_module_relationships += module_result[0]["relationships_created"]
+                for start in range(0, len(edges), batch_size)
+            ]
             
-            # Step 3: Create Module->Module dependency relationships with uniqueness
-            dependencies_created = 0
+            statements = [instance_statement, *module_statements, *edge_statements]
+            if len(modules_payload) + len(edges) <= batch_size:
+                # Small instances run in one write transaction: a single commit, retried as a unit
+                results = await cls.client.execute_many(statements)
+            else:
+                # Larger ones commit per batch so the transaction heap on the server stays O(batch_size)
+                results = [(await cls.client.execute_many([statement]))[0] for statement in statements]
+            instance_result, module_results, dependency_results = (
+                results[0], results[1:1 + len(module_statements)], results[1 + len(module_statements):]
+            )
+            instances_processed = instance_result[0]["instances_processed"] if instance_result else 0
             
-            for edge in edges:
-                # Modified query to ensure unique relationships and track instances
-                dependency_query = """
-                MERGE (m_from:Module { name: $from_name }) 
-                ON CREATE SET m_from.created = timestamp(), m_from.version = $from_version
-                MERGE (m_to:Module { name: $to_name }) 
-                ON CREATE SET m_to.created = timestamp(), m_to.version = $to_version
-                
-                // Create unique DEPENDS_ON relationship
-                MERGE (m_from)-[dep_on:DEPENDS_ON]->(m_to)
-                ON CREATE SET dep_on.created = timestamp(), dep_on.instances = [$instance_name]
-                ON MATCH SET dep_on.instances = 
-                    CASE 
-                        WHEN $instance_name IN dep_on.instances THEN dep_on.instances
-                        ELSE dep_on.instances + $instance_name
-                    END
-                
-                // Create unique DEPENDS_BY relationship
-                MERGE (m_to)-[dep_by:DEPENDS_BY]->(m_from)
-                ON CREATE SET dep_by.created = timestamp(), dep_by.instances = [$instance_name]
-                ON MATCH SET dep_by.instances = 
-                    CASE 
-                        WHEN $instance_name IN dep_by.instances THEN dep_by.instances
-                        ELSE dep_by.instances + $instance_name
-                    END
-                
-                RETURN count(dep_on) as dependencies_created
-                """
-                
-                dependency_result = await cls.client.execute_query(dependency_query, {
-                    "from_name": edge["from_name"],
-                    "to_name": edge["to_name"],
-                    "from_version": edge.get("from_version", "unknown"),
-                    "to_version": edge.get("to_version", "unknown"),
-                    "instance_name": instance_name
-                })
-                
-                if dependency_result:
-                    dependencies_created += dependency_result[0]["dependencies_created"]
+            # Each UNWIND batch returns a single aggregated row, accumulated into totals
+            totals = {"modules_created": 0, "relationships_created": 0, "dependencies_created": 0}
+            for module_result in module_results:
+                totals["modules_created"] += module_result[0]["modules_created"]
+                totals["relationships_created"] += module_result[0]["relationships_created"]
+            for dependency_result in dependency_results:
+                totals["dependencies_created"] += dependency_result[0]["dependencies_created"]
+            
+            # Cached reads may no longer reflect the graph
+            cls.clear_query_cache()
             
-            logger.info(f"Graph ingestion completed for '{instance_name}': {modules_created} modules, {dependencies_created} dependencies")
+            logger.info("Graph ingestion completed for '%s': %d modules, %d dependencies", instance_name, totals["modules_created"], totals["dependencies_created"])
             return {
                 "instances_processed": instances_processed,
-                "modules_created": modules_created,
-                "dependencies_created": dependencies_created,
-                "instance_module_relationships": instance_module_relationships
+                "modules_created": totals["modules_created"],
+                "dependencies_created": totals["dependencies_created"],
+                "instance_module_relationships": totals["relationships_created"]
             }
             
         except Exception as e:
-            logger.error(f"Error ingesting graph data: {e}")
+            logger.error("Error ingesting graph data: %s", e)
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
+    @classmethod
+    async def ingest_many(cls, instances: List[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]]) -> List[Union[Dict[str, int], BaseException]]:
+        """Ingest several independent instances concurrently, bounded by the driver pool size
+        
+        Each entry is an (instance_name, modules, edges) tuple; chunks of the same instance still run
+        sequentially. Results are returned in input order, with exceptions in place of failed instances.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.NEO4J_MAX_POOL_SIZE // 2))
+        
+        async def _ingest_one(instance_name: str, modules: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> Dict[str, int]:
+            async with semaphore:
+                return await cls.ingest_graph(instance_name, modules, edges)
+        
+        return await asyncio.gather(
+            *[_ingest_one(instance_name, modules, edges) for instance_name, modules, edges in instances],
+            return_exceptions=True
+        )
+    
     @classmethod
     async def analyze_cycles(cls) -> Dict[str, Any]:
         """Analyze the graph for cyclic dependencies using APOC procedures"""
@@ -140,13 +251,8 @@ class Neo4jDatabase:
         logger.info("Starting cycle analysis...")
         
         try:
-            # First, check if APOC is available
-            apoc_check_query = "RETURN apoc.version() as version"
-            try:
-                await cls.client.execute_query(apoc_check_query)
-                logger.info("APOC procedures are available")
-            except Exception as apoc_error:
-                logger.warning(f"APOC procedures not available: {apoc_error}")
+            # APOC availability is probed once in initialize()
+            if not cls.apoc_available:
                 return {
                     "cycles_detected": False,
                     "cycles": [],
@@ -155,61 +261,12 @@ class Neo4jDatabase:
                 }
             
             # Execute the cycle detection query
-            cycle_query = """
-            MATCH (m:Module)
-            WITH collect(m) AS modules
-            CALL apoc.nodes.cycles(modules, {relTypes: ['DEPENDS_ON']})
-            YIELD path
-            WITH path, [n IN nodes(path) WHERE 'Module' IN labels(n) | n.name] AS moduleNames
-            MATCH (i:Instance)-[:DEPLOYS]->(m:Module)
-            WHERE m.name IN moduleNames
-            RETURN path, collect(DISTINCT i.name) AS deployingInstances
-            """
-            
-            cycle_results = await cls.client.execute_query(cycle_query)
+            cycle_results = await cls.client.execute_query(_CYCLE_QUERY, {"max_depth": settings.CYCLE_MAX_DEPTH})
             
             cycles = []
             all_responsible_instances = set()
             
             for result in cycle_results:
-                # Extract module names from the path
-                path = result.get("path")
-                deploying_instances = result.get("deployingInstances", [])
-                
-                if path:
-                    # Convert path to list of module names
-                    # The path contains nodes and relationships, we need to extract module names
-                    module_names = []
-                    # This is a simplified extraction - in practice, you might need to parse the path object
-                    # For now, we'll use the moduleNames that should be in the result
-                    # Since the query already extracts moduleNames, we can use that
-                    
-                    # Alternative approach: extract from deployingInstances context
-                    # We'll need to re-query to get the actual cycle path
-                    pass
-                
-                # Add deploying instances to the set
-                all_responsible_instances.update(deploying_instances)
-            
-            # Alternative simpler approach for cycle detection without complex path parsing
-            simple_cycle_query = """
-            MATCH (m:Module)
-            WITH collect(m) AS modules
-            CALL apoc.nodes.cycles(modules, {relTypes: ['DEPENDS_ON']})
-            YIELD path
-            WITH [n IN nodes(path) WHERE 'Module' IN labels(n) | n.name] AS moduleNames
-            WHERE size(moduleNames) > 0
-            MATCH (i:Instance)-[:DEPLOYS]->(m:Module)
-            WHERE m.name IN moduleNames
-            RETURN moduleNames, collect(DISTINCT i.name) AS deployingInstances
-            """
-            
-            simple_results = await cls.client.execute_query(simple_cycle_query)
-            
-            cycles = []
-            all_responsible_instances = set()
-            
-            for result in simple_results:
                 module_names = result.get("moduleNames", [])
                 deploying_instances = result.get("deployingInstances", [])
                 
@@ -222,7 +279,7 @@ class Neo4jDatabase:
             cycles_detected = len(cycles) > 0
             responsible_instances = sorted(list(all_responsible_instances))
             
-            logger.info(f"Cycle analysis completed: {len(cycles)} cycles detected, {len(responsible_instances)} responsible instances")
+            logger.info("Cycle analysis completed: %d cycles detected, %d responsible instances", len(cycles), len(responsible_instances))
             
             return {
                 "cycles_detected": cycles_detected,
@@ -231,7 +288,7 @@ class Neo4jDatabase:
             }
             
         except Exception as e:
-            logger.error(f"Error during cycle analysis: {e}")
+            logger.error("Error during cycle analysis: %s", e)
             # Return safe defaults instead of raising exception
             return {
                 "cycles_detected": False,
@@ -242,12 +299,59 @@ class Neo4jDatabase:
     
     @classmethod
     async def execute_query(cls, query: str, parameters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        """Execute a Cypher query"""
+        """Execute a Cypher query, serving repeated read-only queries from a short-lived cache"""
+        if not cls.client or not cls.client.is_connected:
+            raise HTTPException(status_code=500, detail="Database not connected")
+        
+        cacheable = settings.QUERY_CACHE_TTL > 0 and is_read_query(query)
+        if cacheable:
+            key = query_key(query, parameters)
+            cached = cls._query_cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                cls._query_cache.move_to_end(key)
+                return [dict(record) for record in cached[1]]
+            generation = cls._cache_generation
+        
+        try:
+            records = await cls.client.execute_query(query, parameters)
+        except Exception as e:
+            logger.error("Error executing query: %s", e)
+            raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
+        
+        if cacheable:
+            # Not cached if an ingest or write cleared the cache while this query was running
+            if generation == cls._cache_generation:
+                cls._query_cache[key] = (time.monotonic() + settings.QUERY_CACHE_TTL, tuple(dict(record) for record in records))
+                cls._query_cache.move_to_end(key)
+                while len(cls._query_cache) > settings.QUERY_CACHE_SIZE:
+                    cls._query_cache.popitem(last=False)
+        else:
+            # A write went through; cached reads may be stale
+            cls.clear_query_cache()
+        return records
+    
+    @classmethod
+    async def stream_query(cls, query: str, parameters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Execute a Cypher query and yield its records as they arrive, without caching"""
+        if not cls.client or not cls.client.is_connected:
+            raise HTTPException(status_code=500, detail="Database not connected")
+        
+        try:
+            async for record in cls.client.stream_query(query, parameters):
+                yield record
+        finally:
+            # A write went through (or may have, if the stream failed); cached reads may be stale
+            if not is_read_query(query):
+                cls.clear_query_cache()
+    
+    @classmethod
+    async def execute_scalar(cls, query: str, parameters: Optional[Dict[str, Any]] = None, key: Optional[str] = None) -> List[Any]:
+        """Execute a Cypher query and return only the given column of each record"""
         if not cls.client or not cls.client.is_connected:
             raise HTTPException(status_code=500, detail="Database not connected")
         
         try:
-            return await cls.client.execute_query(query, parameters)
+            return await cls.client.execute_scalar(query, parameters, key)
         except Exception as e:
-            logger.error(f"Error executing query: {e}")
+            logger.error("Error executing query: %s", e)
             raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
\ No newline at end of file
@@ -1,12 +1,15 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
 from routers.graph import router as graph_router
 from db import Neo4jDatabase
+from config import settings
 
 # Configure logging with explicit stdout handler
 logging.basicConfig(
-    level=logging.INFO,
+    level=settings.LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(),  # Ensure logs go to stdout
@@ -14,33 +17,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Add immediate startup logs
-print("=== MAIN.PY LOADING ===")
-logger.info("main.py module loading started")
+_LABELS_QUERY = "CALL db.labels() YIELD label RETURN label"
+
+# One round-trip; the node and relationship counts come from Neo4j's count store, the label count from db.labels()
+_STATS_QUERY = """
+CALL { MATCH (n) RETURN count(n) AS node_count }
+CALL { MATCH ()-[r]->() RETURN count(r) AS relationship_count }
+CALL { CALL db.labels() YIELD label RETURN count(label) AS label_count }
+RETURN node_count, relationship_count, label_count
+"""
 
-# Create FastAPI app first
-app = FastAPI()
+logger.info("main.py module loading started")
 
-# Add startup and shutdown event handlers (older pattern for compatibility)
-@app.on_event("startup")
-async def startup_event():
-    print("=== STARTUP EVENT TRIGGERED ===")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the Neo4j connection on startup and close it on shutdown"""
     logger.info("Application startup event initiated")
     try:
         await Neo4jDatabase.initialize()
         logger.info("Database initialization completed successfully")
-        print("=== DATABASE INITIALIZED SUCCESSFULLY ===")
     except Exception as e:
-        logger.error(f"Failed to initialize database during startup: {e}")
-        print(f"=== DATABASE INITIALIZATION FAILED: {e} ===")
+        logger.error("Failed to initialize database during startup: %s", e)
         raise
-
-@app.on_event("shutdown")
-async def shutdown_event():
+    
+    yield
+    
     logger.info("Application shutdown initiated")
     await Neo4jDatabase.close()
     logger.info("Application shutdown completed")
 
+# No default_response_class: routes with a response_model are serialized to JSON bytes by Pydantic,
+# and ORJSONResponse is deprecated in current FastAPI. /query and /query/stream encode with orjson directly.
+app = FastAPI(lifespan=lifespan)
+
+# Query results are repetitive JSON; small bodies are sent as-is since compressing them isn't worth the CPU
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
 app.include_router(graph_router)
 
 @app.get("/healthcheck")
@@ -60,32 +72,20 @@ async def healthcheck():
 async def get_labels():
     """Example endpoint to get all node labels"""
     try:
-        query = "CALL db.labels()"
-        result = await Neo4jDatabase.execute_query(query)
-        return {"labels": [record["label"] for record in result]}
+        labels = await Neo4jDatabase.execute_scalar(_LABELS_QUERY, key="label")
+        return {"labels": labels}
     except Exception as e:
-        logger.error(f"Error getting labels: {e}")
+        logger.error("Error getting labels: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats")
 async def get_database_stats():
     """Get basic database statistics"""
     try:
-        queries = {
-            "node_count": "MATCH (n) RETURN count(n) as count",
-            "relationship_count": "MATCH ()-[r]->() RETURN count(r) as count",
-            "label_count": "CALL db.labels() YIELD label RETURN count(label) as count"
-        }
-        
-        stats = {}
-        for stat_name, query in queries.items():
-            result = await Neo4jDatabase.execute_query(query)
-            stats[stat_name] = result[0]["count"] if result else 0
-        
-        return stats
+        result = await Neo4jDatabase.execute_query(_STATS_QUERY)
+        return result[0] if result else {"node_count": 0, "relationship_count": 0, "label_count": 0}
     except Exception as e:
-        logger.error(f"Error getting database stats: {e}")
+        logger.error("Error getting database stats: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-print("=== MAIN.PY LOADED SUCCESSFULLY ===")
 logger.info("main.py module loaded successfully")
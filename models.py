@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Dict, List, Any, Optional
 
 class Node(BaseModel):
@@ -9,6 +9,8 @@ class Node(BaseModel):
 
 class Edge(BaseModel):
     """Model for a graph edge - simplified to only require from and to"""
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+
     from_: str = Field(alias="from")  # Source node id
     to: str  # Target node id
     properties: Dict[str, Any] = Field(default_factory=dict)  # Optional additional properties
@@ -55,7 +57,13 @@ class ModuleNode(BaseModel):
     version: Optional[str] = None  # Added to support module versioning
 
 class ModuleEdge(BaseModel):
-    """Model for a module dependency edge from graph-sync response"""
+    """Model for a module dependency edge from graph-sync response
+
+    Stored as a single (:Module)-[:DEPENDS_ON]->(:Module) relationship; there is no
+    mirror DEPENDS_BY edge, so reverse lookups use an undirected -[:DEPENDS_ON]- match.
+    """
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+
     from_: int = Field(alias="from")
     to: int
     type: Optional[str] = "dependency"
@@ -66,7 +74,10 @@ class GraphSyncData(BaseModel):
     edges: List[ModuleEdge]
 
 class InstanceSyncResponse(BaseModel):
-    """Model for a single instance sync response"""
+    """Model for a single instance sync response
+
+    The instance is linked to its modules with (:Instance)-[:DEPLOYS]->(:Module) only.
+    """
     instance: str  # This becomes the instance name
     status: str
     data: Optional[GraphSyncData] = None
@@ -1,156 +1,299 @@
-import os
+import asyncio
+import json
 import logging
-from typing import Dict, Any, List, Optional
-from neo4j import AsyncGraphDatabase
+import re
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Tuple
+from neo4j import READ_ACCESS, WRITE_ACCESS, AsyncGraphDatabase, RoutingControl
 from neo4j.exceptions import ServiceUnavailable, AuthError, ConfigurationError
 
+from config import settings
+
 logger = logging.getLogger(__name__)
 
+# Any write clause, or a procedure CALL other than the known read-only procedures (the catalog
+# procedures and the apoc.nodes.cycles walk behind cycle analysis), marks a query as a write. db.* and
+# dbms.* also hold writers (db.createLabel, dbms.setConfigValue, ...), so they are not exempt as
+# namespaces. CALL { ... } subqueries are judged by the clauses inside them.
+_READ_ONLY_PROCEDURES = (
+    r"(?:db\.labels|db\.relationshipTypes|db\.propertyKeys|db\.schema\.\w+|dbms\.components|apoc\.nodes\.cycles)"
+    r"\b(?!\.)"
+)
+_WRITE_CLAUSE_RE = re.compile(
+    r"\b(CREATE|MERGE|SET|DELETE|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b|\bCALL\s+(?!" + _READ_ONLY_PROCEDURES + r")\w",
+    re.IGNORECASE
+)
+
+_COMPONENTS_QUERY = "CALL dbms.components() YIELD name, versions, edition"
+_HEALTH_QUERY = "RETURN 1 as health"
+
+def is_read_query(query: str) -> bool:
+    """Return True if the Cypher query contains no write clauses and can safely be cached or routed to a reader"""
+    return _WRITE_CLAUSE_RE.search(query) is None
+
+def query_key(query: str, parameters: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """Build a hashable key for a query and its parameters (parameter values may be unhashable lists/maps)"""
+    return query, json.dumps(parameters or {}, sort_keys=True, default=str)
+
 class AsyncNeo4jClient:
     """Async Neo4j client with proper error handling and connection management"""
     
     def __init__(self):
-        self._uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-        self._username = os.getenv("NEO4J_USERNAME", "neo4j")
-        self._password = os.getenv("NEO4J_PASSWORD", "password")
-        self._driver = None
+        self._uri = settings.NEO4J_URI
+        self._username = settings.NEO4J_USERNAME
+        self._password = settings.NEO4J_PASSWORD
+        # Separate pools keep long ingest transactions from starving /query reads of connections
+        self._read_driver = None
+        self._write_driver = None
+        # Shared by both pools so a read is causally chained after the writes this process committed;
+        # each driver's default manager only tracks its own pool, letting a follower serve stale data
+        self._bookmark_manager = AsyncGraphDatabase.bookmark_manager()
         self._connected = False
+        # Identical read queries already in flight, keyed by (write generation, query_key()); later callers
+        # await the same task. The generation is bumped after every write, so a read issued after a write
+        # never joins a task that started before it and could return pre-write rows.
+        self._write_generation = 0
+        self._inflight: Dict[Tuple[int, Tuple[str, str]], asyncio.Task] = {}
         
-        logger.info(f"Initializing Neo4j client with URI: {self._uri}")
-        logger.info(f"Username: {self._username}")
-        logger.info(f"Password length: {len(self._password)} characters")
+        logger.info("Initializing Neo4j client with URI: %s", self._uri)
+        logger.info("Username: %s", self._username)
+        logger.debug("Password length: %d characters", len(self._password))
     
     async def connect(self):
         """Initialize the Neo4j driver and verify connectivity"""
         try:
-            logger.info(f"Attempting to connect to Neo4j at: {self._uri}")
-            logger.info(f"Using username: {self._username}")
+            logger.info("Attempting to connect to Neo4j at: %s", self._uri)
+            logger.info("Using username: %s", self._username)
             
-            # MINIMAL configuration for Neo4j Aura - just URI and auth, nothing else!
-            self._driver = AsyncGraphDatabase.driver(
-                self._uri,
-                auth=(self._username, self._password)
-            )
+            self._write_driver = self._create_driver(settings.NEO4J_MAX_POOL_SIZE)
+            self._read_driver = self._create_driver(settings.NEO4J_READ_MAX_POOL_SIZE)
             
-            logger.info("Neo4j driver created successfully")
+            logger.info("Neo4j drivers created successfully")
             
-            # Test the connection
+            # Test the connection; the driver's handshake replaces a RETURN 1 round-trip
             logger.info("Testing Neo4j connection...")
-            async with self._driver.session() as session:
-                result = await session.run("RETURN 1 as test")
-                record = await result.single()
-                test_value = record["test"]
-                logger.info(f"Connection test successful! Result: {test_value}")
-                
+            await self._write_driver.verify_connectivity()
+            await self._read_driver.verify_connectivity()
+            logger.info("Connection test successful!")
+            
             # Test database info
-            async with self._driver.session() as session:
-                result = await session.run("CALL dbms.components() YIELD name, versions, edition")
-                async for record in result:
-                    logger.info(f"Connected to {record['name']} {record['versions'][0]} {record['edition']}")
-                    break
+            async with self._read_driver.session(database=settings.NEO4J_DATABASE) as session:
+                result = await session.run(_COMPONENTS_QUERY)
+                record = await result.peek()
+                if record:
+                    logger.info("Connected to %s %s %s", record['name'], record['versions'][0], record['edition'])
             
             self._connected = True
             logger.info("Neo4j connection established successfully")
             
         except ServiceUnavailable as e:
-            logger.error(f"Neo4j service unavailable: {e}")
-            logger.error(f"Check if Neo4j Aura instance is running and accessible")
-            self._driver = None
+            logger.error("Neo4j service unavailable: %s", e)
+            logger.error("Check if Neo4j Aura instance is running and accessible")
+            self._read_driver = None
+            self._write_driver = None
             self._connected = False
             raise
         except AuthError as e:
-            logger.error(f"Neo4j authentication failed: {e}")
-            logger.error(f"Check username/password credentials")
-            self._driver = None
+            logger.error("Neo4j authentication failed: %s", e)
+            logger.error("Check username/password credentials")
+            self._read_driver = None
+            self._write_driver = None
             self._connected = False
             raise
         except ConfigurationError as e:
-            logger.error(f"Neo4j configuration error: {e}")
-            logger.error(f"Check URI format and connection parameters")
-            self._driver = None
+            logger.error("Neo4j configuration error: %s", e)
+            logger.error("Check URI format and connection parameters")
+            self._read_driver = None
+            self._write_driver = None
             self._connected = False
             raise
         except Exception as e:
-            logger.error(f"Unexpected error connecting to Neo4j: {type(e).__name__}: {e}")
-            logger.error(f"Connection details - URI: {self._uri}, Username: {self._username}")
-            import traceback
-            logger.error(f"Full traceback: {traceback.format_exc()}")
-            self._driver = None
+            logger.exception("Unexpected error connecting to Neo4j: %s: %s", type(e).__name__, e)
+            logger.error("Connection details - URI: %s, Username: %s", self._uri, self._username)
+            self._read_driver = None
+            self._write_driver = None
             self._connected = False
             raise
 
+    def _create_driver(self, pool_size: int):
+        """Create a driver with its own connection pool of the given size"""
+        # Pool sizing, timeouts and fetch size come from Settings so stuck connections fail fast
+        return AsyncGraphDatabase.driver(
+            self._uri,
+            auth=(self._username, self._password),
+            max_connection_pool_size=pool_size,
+            connection_acquisition_timeout=settings.NEO4J_ACQ_TIMEOUT,
+            connection_timeout=settings.NEO4J_CONNECTION_TIMEOUT,
+            max_transaction_retry_time=settings.NEO4J_MAX_TX_RETRY_TIME,
+            keep_alive=True,
+            fetch_size=settings.NEO4J_FETCH_SIZE
+        )
+
     async def close(self):
-        """Close the Neo4j driver connection"""
-        if self._driver:
+        """Close both Neo4j driver connections"""
+        if self._read_driver or self._write_driver:
             try:
                 logger.info("Closing Neo4j connection...")
-                await self._driver.close()
+                for driver in (self._read_driver, self._write_driver):
+                    if driver:
+                        await driver.close()
                 logger.info("Neo4j connection closed successfully")
             except Exception as e:
-                logger.error(f"Error closing Neo4j connection: {e}")
+                logger.error("Error closing Neo4j connection: %s", e)
             finally:
-                self._driver = None
+                self._read_driver = None
+                self._write_driver = None
                 self._connected = False
 
     @property
     def is_connected(self) -> bool:
         """Check if the client is connected"""
-        return self._connected and self._driver is not None
+        return self._connected and self._read_driver is not None and self._write_driver is not None
 
     @property
     def driver(self):
-        """Get the Neo4j driver instance"""
-        if not self._driver:
+        """Get the Neo4j driver instance used for writes"""
+        if not self._write_driver:
             raise RuntimeError("Neo4j driver not initialized. Call connect() first.")
-        return self._driver
+        return self._write_driver
+
+    def _driver_for(self, routing: RoutingControl):
+        """Pick the read or write pool for a query"""
+        return self._read_driver if routing == RoutingControl.READ else self._write_driver
 
     async def execute_query(self, query: str, parameters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """Execute a Cypher query and return results"""
+        """Execute a Cypher query and return results, sharing one round-trip between identical concurrent reads"""
         if not self.is_connected:
             raise RuntimeError("Not connected to Neo4j. Call connect() first.")
         
-        try:
-            logger.debug(f"Executing query: {query}")
+        if not is_read_query(query):
+            try:
+                return await self._run_query(query, parameters, RoutingControl.WRITE)
+            finally:
+                self.invalidate_reads()
+        
+        key = (self._write_generation, query_key(query, parameters))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_query(query, parameters, RoutingControl.READ))
+            self._inflight[key] = task
+            
+            def _release(finished: asyncio.Task):
+                self._inflight.pop(key, None)
+                # Mark a failure as retrieved even if every waiter was cancelled
+                if not finished.cancelled():
+                    finished.exception()
             
-            # Determine if this is a write operation
-            write_keywords = ['CREATE', 'MERGE', 'SET', 'DELETE', 'REMOVE', 'DETACH DELETE']
-            is_write_operation = any(keyword in query.upper() for keyword in write_keywords)
+            task.add_done_callback(_release)
+        # shield() keeps one cancelled caller from cancelling the query for the others; each caller
+        # gets its own list so one mutating its result doesn't affect the rest
+        return list(await asyncio.shield(task))
+
+    def invalidate_reads(self):
+        """Keep later reads from joining queries already in flight, which may predate a write"""
+        self._write_generation += 1
+
+    async def _run_query(self, query: str, parameters: Dict[str, Any] = None, routing: RoutingControl = RoutingControl.WRITE) -> List[Dict[str, Any]]:
+        """Run a single Cypher query through the driver"""
+        try:
+            logger.debug("Executing query: %s", query)
             
-            async with self._driver.session() as session:
-                if is_write_operation:
-                    # Use write transaction for write operations
-                    async def _execute_write(tx):
-                        result = await tx.run(query, parameters or {})
-                        data = await result.data()
-                        return [record for record in data]
-                    
-                    records = await session.execute_write(_execute_write)
-                else:
-                    # Use regular session for read operations
-                    result = await session.run(query, parameters or {})
-                    data = await result.data()
-                    records = [record for record in data]
-                logger.debug(f"Query returned {len(records)} records")
-                return records
+            # driver.execute_query borrows a pooled connection and runs a managed, retried transaction;
+            # READ routing lets a clustered deployment serve the query from a follower
+            records, _, _ = await self._driver_for(routing).execute_query(
+                query, parameters or {}, database_=settings.NEO4J_DATABASE, routing_=routing,
+                bookmark_manager_=self._bookmark_manager
+            )
+            logger.debug("Query returned %d records", len(records))
+            return [record.data() for record in records]
+        except Exception as e:
+            logger.error("Error executing query: %s", e)
+            logger.error("Query: %s", query)
+            logger.error("Parameters: %s", parameters)
+            raise
+
+    async def execute_many(self, statements: Sequence[Tuple[str, Optional[Dict[str, Any]]]]) -> List[List[Dict[str, Any]]]:
+        """Execute several Cypher statements in a single managed write transaction with one commit"""
+        if not self.is_connected:
+            raise RuntimeError("Not connected to Neo4j. Call connect() first.")
+        
+        async def _run_statements(tx):
+            results = []
+            for query, parameters in statements:
+                result = await tx.run(query, parameters or {})
+                results.append([record.data() async for record in result])
+            return results
+        
+        try:
+            logger.debug("Executing %d statements in one transaction", len(statements))
+            async with self._write_driver.session(
+                database=settings.NEO4J_DATABASE, bookmark_manager=self._bookmark_manager
+            ) as session:
+                return await session.execute_write(_run_statements)
+        except Exception as e:
+            logger.error("Error executing batched statements: %s", e)
+            raise
+        finally:
+            self.invalidate_reads()
+
+    async def stream_query(self, query: str, parameters: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Execute a Cypher query and yield records one at a time as they are fetched"""
+        if not self.is_connected:
+            raise RuntimeError("Not connected to Neo4j. Call connect() first.")
+        
+        logger.debug("Streaming query: %s", query)
+        read_only = is_read_query(query)
+        if read_only:
+            driver, access_mode = self._read_driver, READ_ACCESS
+        else:
+            driver, access_mode = self._write_driver, WRITE_ACCESS
+        try:
+            async with driver.session(
+                database=settings.NEO4J_DATABASE, default_access_mode=access_mode, bookmark_manager=self._bookmark_manager
+            ) as session:
+                result = await session.run(query, parameters or {})
+                async for record in result:
+                    yield record.data()
+        finally:
+            if not read_only:
+                self.invalidate_reads()
+
+    async def execute_scalar(self, query: str, parameters: Dict[str, Any] = None, key: str = None) -> List[Any]:
+        """Execute a read query and return a single column per record, skipping the per-record dict build"""
+        if not self.is_connected:
+            raise RuntimeError("Not connected to Neo4j. Call connect() first.")
+        
+        routing = RoutingControl.READ if is_read_query(query) else RoutingControl.WRITE
+        try:
+            logger.debug("Executing scalar query: %s", query)
+            records, _, _ = await self._driver_for(routing).execute_query(
+                query, parameters or {}, database_=settings.NEO4J_DATABASE, routing_=routing,
+                bookmark_manager_=self._bookmark_manager
+            )
+            return [record[key] if key is not None else record[0] for record in records]
         except Exception as e:
-            logger.error(f"Error executing query: {e}")
-            logger.error(f"Query: {query}")
-            logger.error(f"Parameters: {parameters}")
+            logger.error("Error executing query: %s", e)
+            logger.error("Query: %s", query)
+            logger.error("Parameters: %s", parameters)
             raise
+        finally:
+            if routing == RoutingControl.WRITE:
+                self.invalidate_reads()
 
     async def health_check(self) -> bool:
         """Check if the Neo4j connection is healthy"""
         try:
-            if not self._driver or not self._connected:
+            if not self.is_connected:
                 logger.warning("Health check failed: driver not connected")
                 return False
             
-            async with self._driver.session() as session:
-                result = await session.run("RETURN 1 as health")
+            # A single auto-commit query, not driver.execute_query: the managed transaction retries for up
+            # to NEO4J_MAX_TX_RETRY_TIME, which would hang probes exactly when the database is down
+            async with self._read_driver.session(database=settings.NEO4J_DATABASE, default_access_mode=READ_ACCESS) as session:
+                result = await session.run(_HEALTH_QUERY)
                 record = await result.single()
-                health_status = record and record["health"] == 1
-                logger.debug(f"Health check result: {health_status}")
-                return health_status
+            health_status = record is not None and record["health"] == 1
+            logger.debug("Health check result: %s", health_status)
+            return health_status
         except Exception as e:
-            logger.error(f"Health check failed: {e}")
+            logger.error("Health check failed: %s", e)
             return False
\ No newline at end of file
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 import logging
+import orjson
 import time
+from typing import Any, Dict, List, Optional, Tuple
 
+from config import settings
 from db import Neo4jDatabase
 from models import (
     GraphPayload, QueryRequest, QueryResponse, IngestResponse, 
@@ -14,56 +20,111 @@ router = APIRouter(prefix="/api/graph", tags=["graph"])
 # Configure logging
 logger = logging.getLogger(__name__)
 
-@router.post("/ingest", response_model=IngestResponse)
-async def ingest_graph(payload: MultiInstanceSyncResponse):
+def _inline_schema(model) -> Dict[str, Any]:
+    """JSON schema of a model with its $defs inlined, so it can be embedded in an OpenAPI operation"""
+    schema = model.model_json_schema()
+    # "#/$defs/..." refs would resolve against the OpenAPI document root, so substitute them in place
+    defs = schema.pop("$defs", {})
+    
+    def _resolve(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref and ref.startswith("#/$defs/"):
+                return _resolve(defs[ref[len("#/$defs/"):]])
+            return {key: _resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [_resolve(value) for value in node]
+        return node
+    
+    return _resolve(schema)
+
+# /ingest validates the raw body itself, so the request schema is declared for /docs explicitly
+_INGEST_OPENAPI = {
+    "requestBody": {
+        "content": {"application/json": {"schema": _inline_schema(MultiInstanceSyncResponse)}},
+        "required": True
+    }
+}
+
+def _prepare_instance(instance_response: InstanceSyncResponse) -> Optional[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """Convert one graph-sync instance response into (instance_name, modules, edges), or None if it is skipped"""
+    if instance_response.status != "success" or not instance_response.data:
+        logger.warning("Skipping instance '%s': %s", instance_response.instance, instance_response.error or 'No data')
+        return None
+    
+    graph_data = instance_response.data
+    instance_name = instance_response.instance
+    
+    # Convert graph_sync format to schema-compliant format and build the node ID -> module name
+    # mapping used for edge processing in the same pass over the nodes. Node and edge IDs are both
+    # validated as ints, so the mapping is keyed on the raw IDs without any string conversion.
+    modules = []
+    id_to_name = {}
+    append_module = modules.append
+    for node in graph_data.nodes:
+        id_to_name[node.id] = node.label
+        append_module({
+            "name": node.label,  # Module name
+            "version": node.version or "unknown"  # Module version if available
+        })
+    
+    # Duplicate (from, to) pairs are dropped by Neo4jDatabase.ingest_graph. Only the endpoint names are
+    # sent: every edge becomes a DEPENDS_ON relationship, so the graph-sync edge type is not stored.
+    edges = []
+    get_name = id_to_name.get
+    for edge in graph_data.edges:
+        if (from_name := get_name(edge.from_)) and (to_name := get_name(edge.to)):
+            edges.append({"from_name": from_name, "to_name": to_name})
+        else:
+            logger.warning("Skipping edge with missing nodes: %s -> %s", edge.from_, edge.to)
+    
+    # Log the ingestion request
+    logger.info("Ingesting graph from instance '%s' with %d modules and %d dependencies", instance_name, len(modules), len(edges))
+    return instance_name, modules, edges
+
+@router.post("/ingest", response_model=IngestResponse, openapi_extra=_INGEST_OPENAPI)
+async def ingest_graph(request: Request):
     """Ingest nodes and edges into the graph database with post-ingestion cycle analysis"""
+    # Reject oversized bodies before reading them when the client declares a length
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.INGEST_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Payload too large")
+    
+    # The header may be missing (chunked transfer) or wrong, so the limit is also enforced while reading
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > settings.INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    
+    # Validate the raw body straight from JSON bytes in pydantic-core instead of letting FastAPI
+    # decode it into Python dicts first, which would hold two copies of a large payload
+    try:
+        payload = MultiInstanceSyncResponse.model_validate_json(body)
+    except ValidationError as e:
+        # Prefix "body" to each location, as FastAPI does for body parameters it validates itself
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+    
     try:
         total_modules_created = 0
         total_dependencies_created = 0
         processed_instances = 0
         
-        # Process each instance response
-        for instance_response in payload.responses:
-            if instance_response.status != "success" or not instance_response.data:
-                logger.warning(f"Skipping instance '{instance_response.instance}': {instance_response.error or 'No data'}")
-                continue
-            
-            graph_data = instance_response.data
-            instance_name = instance_response.instance
-            
-            # Convert graph_sync format to schema-compliant format
-            modules = []
-            for node in graph_data.nodes:
-                modules.append({
-                    "name": node.label,  # Module name
-                    "version": getattr(node, 'version', 'unknown'),  # Module version if available
-                    "id": str(node.id)  # Keep original ID for edge mapping
-                })
-            
-            # Create a mapping from node ID to module name for edge processing
-            id_to_name = {str(node.id): node.label for node in graph_data.nodes}
-            
-            edges = []
-            for edge in graph_data.edges:
-                from_name = id_to_name.get(str(edge.from_))
-                to_name = id_to_name.get(str(edge.to))
-                
-                if from_name and to_name:
-                    edges.append({
-                        "from_name": from_name,
-                        "to_name": to_name,
-                        "from_version": "unknown",  # Could be extracted from node data if available
-                        "to_version": "unknown",    # Could be extracted from node data if available
-                        "type": edge.type or "dependency"
-                    })
-                else:
-                    logger.warning(f"Skipping edge with missing nodes: {edge.from_} -> {edge.to}")
-            
-            # Log the ingestion request
-            logger.info(f"Ingesting graph from instance '{instance_name}' with {len(modules)} modules and {len(edges)} dependencies")
-            
-            # Process the ingestion using the new schema
-            result = await Neo4jDatabase.ingest_graph(instance_name, modules, edges)
+        # Convert each instance response, dropping the ones that were skipped
+        instances_to_ingest = [
+            prepared for prepared in map(_prepare_instance, payload.responses) if prepared is not None
+        ]
+        
+        # Independent instances are ingested concurrently
+        results = await Neo4jDatabase.ingest_many(instances_to_ingest)
+        
+        for (instance_name, _, _), result in zip(instances_to_ingest, results):
+            if isinstance(result, BaseException):
+                logger.error("Ingestion failed for instance '%s': %s", instance_name, result)
+                raise result
             
             total_modules_created += result["modules_created"]
             total_dependencies_created += result["dependencies_created"]
@@ -81,7 +142,7 @@ async def ingest_graph(payload: MultiInstanceSyncResponse):
         
         # Log cycle analysis results
         if cycle_analysis.cycles_detected:
-            logger.warning(f"Cycles detected: {len(cycle_analysis.cycles)} cycles involving {len(cycle_analysis.responsible_instances)} instances")
+            logger.warning("Cycles detected: %d cycles involving %d instances", len(cycle_analysis.cycles), len(cycle_analysis.responsible_instances))
         else:
             logger.info("No cycles detected in the dependency graph")
         
@@ -94,7 +155,7 @@ async def ingest_graph(payload: MultiInstanceSyncResponse):
             cycle_analysis=cycle_analysis
         )
     except Exception as e:
-        logger.error(f"Error in graph ingestion: {str(e)}")
+        logger.error("Error in graph ingestion: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/query", response_model=QueryResponse)
@@ -108,10 +169,38 @@ async def execute_query(request: QueryRequest):
         
         execution_time = time.time() - start_time
         
-        return QueryResponse(
-            results=results,
-            execution_time=execution_time
+        # Encode straight to JSON with orjson: returning a Response skips the response_model validation
+        # and jsonable_encoder pass over every result row (QueryResponse still documents the shape)
+        return Response(
+            content=orjson.dumps({"results": results, "execution_time": execution_time}, default=str),
+            media_type="application/json"
         )
     except Exception as e:
-        logger.error(f"Error executing query: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error("Error executing query: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """Execute a Cypher query and stream the records back as NDJSON, one JSON object per line"""
+    records = Neo4jDatabase.stream_query(request.query, request.parameters)
+    
+    # Pull the first record before the response starts so query errors still map to an HTTP 500
+    try:
+        first_record = await records.__anext__()
+    except StopAsyncIteration:
+        first_record = None
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error streaming query: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def _encode():
+        if first_record is None:
+            return
+        # default=str covers Neo4j temporal/spatial values that orjson cannot encode natively
+        yield orjson.dumps(first_record, default=str) + b"\n"
+        async for record in records:
+            yield orjson.dumps(record, default=str) + b"\n"
+    
+    return StreamingResponse(_encode(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -0,0 +1,89 @@
+import os
+import sys
+
+import pytest
+
+# The app modules are imported as top-level modules (``import db``), as uvicorn does with main:app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import neo4j_client
+from db import Neo4jDatabase
+from routers import graph
+
+class FakeRecord:
+    """Stand-in for neo4j.Record supporting the access patterns used by the clients"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def data(self):
+        return dict(self._data)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self._data.values())[key]
+        return self._data[key]
+
+class FakeDatabaseClient:
+    """Stand-in for AsyncNeo4jClient that records the statements Neo4jDatabase sends"""
+
+    is_connected = True
+
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else [{"value": 1}]
+        self.queries = []
+        self.transactions = []
+        self.invalidations = 0
+
+    async def execute_query(self, query, parameters=None):
+        self.queries.append((query, parameters))
+        return [dict(row) for row in self.rows]
+
+    async def stream_query(self, query, parameters=None):
+        self.queries.append((query, parameters))
+        for row in self.rows:
+            yield dict(row)
+
+    def invalidate_reads(self):
+        self.invalidations += 1
+
+    async def execute_many(self, statements):
+        self.transactions.append(list(statements))
+        results = []
+        for query, parameters in statements:
+            if "rows" in parameters:
+                count = len(parameters["rows"])
+                results.append([{"modules_created": count, "relationships_created": count}])
+            elif "from_names" in parameters:
+                results.append([{"dependencies_created": len(parameters["from_names"])}])
+            else:
+                results.append([{"instances_processed": 1}])
+        return results
+
+@pytest.fixture(autouse=True)
+def reset_database():
+    """Give every test a disconnected Neo4jDatabase with an empty query cache"""
+    Neo4jDatabase.client = None
+    Neo4jDatabase.apoc_available = False
+    Neo4jDatabase.clear_query_cache()
+    yield
+    Neo4jDatabase.client = None
+    Neo4jDatabase.clear_query_cache()
+
+@pytest.fixture
+def override_settings(monkeypatch):
+    """Replace the frozen settings seen by the app modules with a copy carrying the given overrides"""
+    def _override(**overrides):
+        patched = db.settings.model_copy(update=overrides)
+        for module in (db, neo4j_client, graph):
+            monkeypatch.setattr(module, "settings", patched)
+        return patched
+    return _override
+
+@pytest.fixture
+def fake_client():
+    """Install a FakeDatabaseClient as Neo4jDatabase.client"""
+    client = FakeDatabaseClient()
+    Neo4jDatabase.client = client
+    return client
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import db
+from db import Neo4jDatabase, _EDGES_UNWIND, _EDGES_UNWIND_UNTRACKED, _INSTANCE_MERGE, _MODULES_UNWIND
+
+READ_QUERY = "MATCH (m:Module) RETURN m.name AS name"
+
+def test_read_queries_are_served_from_cache(fake_client):
+    first = asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    second = asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert first == second == [{"value": 1}]
+    assert len(fake_client.queries) == 1
+
+def test_cache_keys_on_parameters(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY, {"name": "a"}))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY, {"name": "b"}))
+    assert len(fake_client.queries) == 2
+
+def test_cache_hits_are_independent_copies(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY)).append({"value": 2})
+    hit = asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    hit.clear()
+    assert asyncio.run(Neo4jDatabase.execute_query(READ_QUERY)) == [{"value": 1}]
+
+def test_cached_records_are_independent_copies(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))[0]["value"] = "changed by the first caller"
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))[0]["value"] = "changed by a cache hit"
+    assert asyncio.run(Neo4jDatabase.execute_query(READ_QUERY)) == [{"value": 1}]
+    assert len(fake_client.queries) == 1
+
+def test_cache_entries_expire(fake_client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db.time, "monotonic", lambda: now[0])
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    now[0] += db.settings.QUERY_CACHE_TTL + 1
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 2
+
+def test_cache_evicts_least_recently_used(fake_client, override_settings):
+    override_settings(QUERY_CACHE_SIZE=2)
+    for name in ("a", "b", "a", "c"):
+        asyncio.run(Neo4jDatabase.execute_query(READ_QUERY, {"name": name}))
+    # "b" was the least recently used when "c" was added
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY, {"name": "a"}))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY, {"name": "b"}))
+    assert [parameters["name"] for _, parameters in fake_client.queries] == ["a", "b", "c", "b"]
+
+def test_cache_disabled_with_zero_ttl(fake_client, override_settings):
+    override_settings(QUERY_CACHE_TTL=0)
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 2
+
+def test_write_query_clears_cache(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    asyncio.run(Neo4jDatabase.execute_query("CREATE (m:Module {name: 'x'})"))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 3
+
+async def _drain(records):
+    return [record async for record in records]
+
+def test_streamed_write_clears_cache(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    asyncio.run(_drain(Neo4jDatabase.stream_query("CREATE (m:Module {name: 'x'}) RETURN m.name AS name")))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 3
+
+def test_streamed_read_keeps_cache(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert asyncio.run(_drain(Neo4jDatabase.stream_query(READ_QUERY))) == [{"value": 1}]
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 2
+
+def test_read_racing_a_clear_is_not_cached(fake_client):
+    release = asyncio.Event()
+    execute_query = fake_client.execute_query
+
+    async def slow_execute_query(query, parameters=None):
+        await release.wait()
+        return await execute_query(query, parameters)
+
+    fake_client.execute_query = slow_execute_query
+
+    async def scenario():
+        read = asyncio.ensure_future(Neo4jDatabase.execute_query(READ_QUERY))
+        await asyncio.sleep(0)
+        # An ingest finishes while the read is still running
+        Neo4jDatabase.clear_query_cache()
+        release.set()
+        await read
+
+    asyncio.run(scenario())
+    assert len(Neo4jDatabase._query_cache) == 0
+
+def test_query_errors_map_to_http_500(fake_client):
+    async def failing_execute_query(query, parameters=None):
+        raise RuntimeError("boom")
+
+    fake_client.execute_query = failing_execute_query
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert excinfo.value.status_code == 500
+
+def test_ingest_requires_connection():
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(Neo4jDatabase.ingest_graph("instance", [], []))
+    assert excinfo.value.status_code == 500
+
+def _modules(*names):
+    return [{"name": name, "version": "1.0"} for name in names]
+
+def _edges(*pairs):
+    return [{"from_name": from_name, "to_name": to_name} for from_name, to_name in pairs]
+
+def test_small_ingest_runs_in_one_transaction(fake_client):
+    result = asyncio.run(Neo4jDatabase.ingest_graph("instance", _modules("b", "a"), _edges(("b", "a"))))
+    assert result == {
+        "instances_processed": 1,
+        "modules_created": 2,
+        "dependencies_created": 1,
+        "instance_module_relationships": 2
+    }
+    assert len(fake_client.transactions) == 1
+    assert [query for query, _ in fake_client.transactions[0]] == [_INSTANCE_MERGE, _MODULES_UNWIND, _EDGES_UNWIND]
+
+def test_large_ingest_commits_per_batch(fake_client, override_settings):
+    override_settings(INGEST_BATCH_SIZE=2)
+    modules = _modules("e", "d", "c", "b", "a")
+    edges = _edges(("a", "b"), ("b", "c"), ("c", "d"))
+    result = asyncio.run(Neo4jDatabase.ingest_graph("instance", modules, edges))
+
+    # Instance, three module batches (2 + 2 + 1) and two edge batches (2 + 1), each committed on its own
+    assert len(fake_client.transactions) == 6
+    assert all(len(statements) == 1 for statements in fake_client.transactions)
+    module_rows = [statements[0][1]["rows"] for statements in fake_client.transactions[1:4]]
+    assert [len(rows) for rows in module_rows] == [2, 2, 1]
+    edge_columns = [statements[0][1]["from_names"] for statements in fake_client.transactions[4:]]
+    assert edge_columns == [["a", "b"], ["c"]]
+    assert result["modules_created"] == 5
+    assert result["dependencies_created"] == 3
+
+def test_ingest_dedupes_and_sorts_rows(fake_client):
+    modules = [{"name": "b", "version": "1.0"}, {"name": "a", "version": "1.0"}, {"name": "b", "version": "2.0"}]
+    edges = _edges(("b", "a"), ("a", "b"), ("b", "a"))
+    asyncio.run(Neo4jDatabase.ingest_graph("instance", modules, edges))
+
+    statements = fake_client.transactions[0]
+    # Last version wins per module name; rows are ordered by name for consistent lock order
+    assert statements[1][1]["rows"] == [{"name": "a", "version": "1.0"}, {"name": "b", "version": "2.0"}]
+    assert statements[2][1]["from_names"] == ["a", "b"]
+    assert statements[2][1]["to_names"] == ["b", "a"]
+
+def test_ingest_without_instance_tracking(fake_client, override_settings):
+    override_settings(TRACK_DEPENDENCY_INSTANCES=False)
+    asyncio.run(Neo4jDatabase.ingest_graph("instance", _modules("a", "b"), _edges(("a", "b"))))
+    assert fake_client.transactions[0][2][0] == _EDGES_UNWIND_UNTRACKED
+
+def test_ingest_clears_query_cache(fake_client):
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    asyncio.run(Neo4jDatabase.ingest_graph("instance", _modules("a"), []))
+    asyncio.run(Neo4jDatabase.execute_query(READ_QUERY))
+    assert len(fake_client.queries) == 2
+
+def test_ingest_many_returns_results_in_order_with_exceptions(fake_client):
+    instances = [
+        ("first", _modules("a"), []),
+        ("second", [{"version": "1.0"}], []),  # missing "name" fails this instance only
+        ("third", _modules("b", "c"), [])
+    ]
+    results = asyncio.run(Neo4jDatabase.ingest_many(instances))
+    assert results[0]["modules_created"] == 1
+    assert isinstance(results[1], Exception)
+    assert results[2]["modules_created"] == 2
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db import Neo4jDatabase
+from models import InstanceSyncResponse
+from routers.graph import _prepare_instance, router
+
+app = FastAPI()
+app.include_router(router)
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def _instance_payload(instance="instance-a"):
+    return {
+        "instance": instance,
+        "status": "success",
+        "data": {
+            "nodes": [
+                {"id": 1, "label": "sale", "version": "17.0"},
+                {"id": 2, "label": "account"},
+            ],
+            "edges": [
+                {"from": 1, "to": 2, "type": "depends"},
+                {"from": 1, "to": 99},
+            ]
+        }
+    }
+
+def test_prepare_instance_converts_nodes_and_edges():
+    instance = InstanceSyncResponse.model_validate(_instance_payload())
+    instance_name, modules, edges = _prepare_instance(instance)
+    assert instance_name == "instance-a"
+    assert modules == [{"name": "sale", "version": "17.0"}, {"name": "account", "version": "unknown"}]
+    # The edge to the unknown node 99 is skipped
+    assert edges == [{"from_name": "sale", "to_name": "account"}]
+
+def test_prepare_instance_skips_failed_instances():
+    instance = InstanceSyncResponse(instance="instance-b", status="error", error="timeout")
+    assert _prepare_instance(instance) is None
+
+def test_ingest_converts_and_ingests_each_instance(client, fake_client):
+    response = client.post("/api/graph/ingest", json={"responses": [_instance_payload()]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["processed_instances"] == 1
+    assert body["nodes_created"] == 2
+    assert body["edges_created"] == 1
+
+def test_ingest_rejects_invalid_payload(client):
+    response = client.post("/api/graph/ingest", content=b'{"responses": [{"status": "success"}]}')
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "responses", 0, "instance"]
+
+def test_ingest_rejects_malformed_json(client):
+    response = client.post("/api/graph/ingest", content=b'{"responses": [')
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][0] == "body"
+
+def test_ingest_rejects_declared_oversized_body(client, override_settings):
+    override_settings(INGEST_MAX_BODY_BYTES=16)
+    response = client.post("/api/graph/ingest", content=b"x" * 17)
+    assert response.status_code == 413
+
+def test_ingest_rejects_oversized_chunked_body(client, override_settings):
+    override_settings(INGEST_MAX_BODY_BYTES=100)
+
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 50
+
+    # A generator body is sent with chunked transfer encoding and no Content-Length
+    response = client.post("/api/graph/ingest", content=chunks())
+    assert response.status_code == 413
+
+def test_ingest_request_body_is_documented():
+    request_body = app.openapi()["paths"]["/api/graph/ingest"]["post"]["requestBody"]
+    schema = request_body["content"]["application/json"]["schema"]
+    assert request_body["required"] is True
+    assert "responses" in schema["properties"]
+    assert "$ref" not in json.dumps(schema)
+
+class FakeStream:
+    """Replaces Neo4jDatabase.stream_query with a generator over fixed records"""
+
+    def __init__(self, records, error=None):
+        self.records = records
+        self.error = error
+
+    async def __call__(self, query, parameters=None):
+        if self.error:
+            raise self.error
+        for record in self.records:
+            yield record
+
+def test_stream_query_returns_ndjson(client, monkeypatch):
+    monkeypatch.setattr(Neo4jDatabase, "stream_query", FakeStream([{"name": "a"}, {"name": "b"}]))
+    response = client.post("/api/graph/query/stream", json={"query": "MATCH (m) RETURN m.name AS name"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"name": "a"}, {"name": "b"}]
+
+def test_stream_query_with_no_records_returns_empty_body(client, monkeypatch):
+    monkeypatch.setattr(Neo4jDatabase, "stream_query", FakeStream([]))
+    response = client.post("/api/graph/query/stream", json={"query": "MATCH (m) RETURN m"})
+    assert response.status_code == 200
+    assert response.content == b""
+
+def test_stream_query_error_before_first_record_is_http_500(client, monkeypatch):
+    monkeypatch.setattr(Neo4jDatabase, "stream_query", FakeStream([], error=RuntimeError("syntax error")))
+    response = client.post("/api/graph/query/stream", json={"query": "MATCH (m RETURN m"})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "syntax error"
+
+def test_query_returns_results(client, fake_client):
+    response = client.post("/api/graph/query", json={"query": "MATCH (m) RETURN 1 AS value"})
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"value": 1}]
@@ -0,0 +1,208 @@
+import asyncio
+
+import pytest
+from neo4j import RoutingControl
+
+from conftest import FakeRecord
+from db import Neo4jDatabase, _CYCLE_QUERY
+from neo4j_client import AsyncNeo4jClient, is_read_query, query_key
+
+class FakeDriver:
+    """Stand-in for neo4j.AsyncDriver whose queries can be held open until released"""
+
+    def __init__(self, rows=None, fail=False):
+        self.rows = rows if rows is not None else [{"value": 1}]
+        self.fail = fail
+        self.calls = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def execute_query(self, query, parameters=None, **kwargs):
+        self.calls.append((query, parameters, kwargs))
+        # Rows are read when the query starts, like a transaction snapshot
+        rows = list(self.rows)
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("query failed")
+        return [FakeRecord(row) for row in rows], None, None
+
+def make_client(read_driver=None, write_driver=None):
+    client = AsyncNeo4jClient()
+    client._read_driver = read_driver or FakeDriver()
+    client._write_driver = write_driver or FakeDriver()
+    client._connected = True
+    return client
+
+@pytest.mark.parametrize("query", [
+    "MATCH (n) RETURN n",
+    "MATCH (n) WHERE n.created > 0 RETURN n.name AS offset",
+    "CALL db.labels() YIELD label RETURN label",
+    "CALL db.relationshipTypes()",
+    "CALL db.propertyKeys()",
+    "CALL db.schema.visualization()",
+    "CALL dbms.components() YIELD name, versions, edition",
+    "CALL { MATCH (n) RETURN count(n) AS c } RETURN c",
+    "CALL apoc.nodes.cycles([], {relTypes: ['DEPENDS_ON']}) YIELD path RETURN path",
+    _CYCLE_QUERY,
+])
+def test_is_read_query_accepts_reads(query):
+    assert is_read_query(query)
+
+@pytest.mark.parametrize("query", [
+    "CREATE (n:Module {name: 'a'})",
+    "MATCH (n) SET n.x = 1",
+    "MATCH (n) DETACH DELETE n",
+    "merge (n:Module {name: 'a'})",
+    "LOAD CSV FROM 'file:///x.csv' AS row RETURN row",
+    "CALL db.createLabel('X')",
+    "CALL db.createProperty('x')",
+    "CALL db.index.fulltext.createNodeIndex('idx', ['Module'], ['name'])",
+    "CALL dbms.setConfigValue('db.logs.query.enabled', 'off')",
+    "CALL db.labelsAndMore()",
+    "CALL apoc.create.node(['Module'], {name: 'a'})",
+    "CALL { MATCH (n) SET n.seen = true } RETURN 1",
+])
+def test_is_read_query_rejects_writes(query):
+    assert not is_read_query(query)
+
+def test_query_key_ignores_parameter_order_and_accepts_lists():
+    assert query_key("RETURN 1", {"a": [1, 2], "b": 2}) == query_key("RETURN 1", {"b": 2, "a": [1, 2]})
+    assert query_key("RETURN 1") == query_key("RETURN 1", {})
+
+def test_reads_and_writes_use_separate_pools():
+    async def scenario():
+        client = make_client()
+        await client.execute_query("MATCH (n) RETURN n")
+        await client.execute_query("CREATE (n:Module)")
+        return client
+
+    client = asyncio.run(scenario())
+    assert client._read_driver.calls[0][2]["routing_"] == RoutingControl.READ
+    assert client._write_driver.calls[0][2]["routing_"] == RoutingControl.WRITE
+    # Both pools share one bookmark manager so reads observe earlier writes
+    assert client._read_driver.calls[0][2]["bookmark_manager_"] is client._write_driver.calls[0][2]["bookmark_manager_"]
+
+def test_identical_concurrent_reads_share_one_round_trip():
+    async def scenario():
+        driver = FakeDriver()
+        driver.release.clear()
+        client = make_client(read_driver=driver)
+        tasks = [asyncio.ensure_future(client.execute_query("MATCH (n) RETURN n", {"a": 1})) for _ in range(3)]
+        await asyncio.sleep(0)
+        driver.release.set()
+        results = await asyncio.gather(*tasks)
+        return client, driver, results
+
+    client, driver, results = asyncio.run(scenario())
+    assert len(driver.calls) == 1
+    assert results == [[{"value": 1}]] * 3
+    # Every caller owns its list
+    assert len({id(result) for result in results}) == 3
+    assert client._inflight == {}
+
+def test_writes_are_not_coalesced():
+    async def scenario():
+        driver = FakeDriver()
+        client = make_client(write_driver=driver)
+        await asyncio.gather(*[client.execute_query("CREATE (n:Module)") for _ in range(2)])
+        return driver
+
+    assert len(asyncio.run(scenario()).calls) == 2
+
+def test_cancelled_caller_does_not_cancel_shared_read():
+    async def scenario():
+        driver = FakeDriver()
+        driver.release.clear()
+        client = make_client(read_driver=driver)
+        first = asyncio.ensure_future(client.execute_query("MATCH (n) RETURN n"))
+        second = asyncio.ensure_future(client.execute_query("MATCH (n) RETURN n"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        driver.release.set()
+        return first, await second, driver
+
+    first, second_result, driver = asyncio.run(scenario())
+    assert first.cancelled()
+    assert second_result == [{"value": 1}]
+    assert len(driver.calls) == 1
+
+def test_read_issued_after_a_write_does_not_join_an_older_read():
+    async def scenario():
+        driver = FakeDriver(rows=[{"v": "old"}])
+        driver.release.clear()
+        client = make_client(read_driver=driver)
+        before = asyncio.ensure_future(client.execute_query("MATCH (n) RETURN n.v AS v"))
+        while not driver.calls:
+            await asyncio.sleep(0)
+        await client.execute_query("MATCH (n) SET n.v = 'new'")
+        driver.rows = [{"v": "new"}]
+        after = asyncio.ensure_future(client.execute_query("MATCH (n) RETURN n.v AS v"))
+        await asyncio.sleep(0)
+        driver.release.set()
+        return await before, await after, driver
+
+    before, after, driver = asyncio.run(scenario())
+    assert before == [{"v": "old"}]
+    assert after == [{"v": "new"}]
+    assert len(driver.calls) == 2
+
+def test_read_issued_after_a_cache_clear_is_not_served_stale_rows():
+    async def scenario():
+        driver = FakeDriver(rows=[{"v": "old"}])
+        driver.release.clear()
+        Neo4jDatabase.client = make_client(read_driver=driver)
+        before = asyncio.ensure_future(Neo4jDatabase.execute_query("MATCH (n) RETURN n.v AS v"))
+        while not driver.calls:
+            await asyncio.sleep(0)
+        # An ingest commits and invalidates cached reads while the first read is still running
+        driver.rows = [{"v": "new"}]
+        Neo4jDatabase.clear_query_cache()
+        after = asyncio.ensure_future(Neo4jDatabase.execute_query("MATCH (n) RETURN n.v AS v"))
+        await asyncio.sleep(0)
+        driver.release.set()
+        await before
+        after_result = await after
+        # Served from the cache, which must now hold the post-ingest rows
+        cached = await Neo4jDatabase.execute_query("MATCH (n) RETURN n.v AS v")
+        return after_result, cached, driver
+
+    after, cached, driver = asyncio.run(scenario())
+    assert after == cached == [{"v": "new"}]
+    assert len(driver.calls) == 2
+
+def test_failed_read_propagates_and_is_not_kept_in_flight():
+    async def scenario():
+        client = make_client(read_driver=FakeDriver(fail=True))
+        with pytest.raises(RuntimeError):
+            await client.execute_query("MATCH (n) RETURN n")
+        return client
+
+    assert asyncio.run(scenario())._inflight == {}
+
+def test_execute_scalar_returns_one_column():
+    async def scenario():
+        client = make_client(read_driver=FakeDriver(rows=[{"label": "Module"}, {"label": "Instance"}]))
+        return await client.execute_scalar("CALL db.labels() YIELD label RETURN label", key="label")
+
+    assert asyncio.run(scenario()) == ["Module", "Instance"]
+
+def test_health_check_reports_unreachable_database():
+    async def scenario():
+        # Nothing listens on port 1, so the connection is refused straight away
+        client = make_client()
+        client._uri = "bolt://127.0.0.1:1"
+        client._read_driver = client._create_driver(1)
+        try:
+            return await client.health_check()
+        finally:
+            await client._read_driver.close()
+
+    assert asyncio.run(scenario()) is False
+
+def test_queries_require_connection():
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await AsyncNeo4jClient().execute_query("RETURN 1")
+
+    asyncio.run(scenario())